@@ -5,10 +5,15 @@
 @author : pritam
 """
 
+import hashlib
+import json
 import os
-import re
+import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -21,8 +26,16 @@ from dateutil.tz import UTC, tzlocal
 
 VERBOSE_MODE = False
 
+_AWS_CLI_VERSION_CHECKED: Optional[bool] = None
+_BOTOCORE_SESSION: Optional[botocore.session.Session] = None
+_SSO_CLIENTS: dict = {}
+_CONFIG_FILE_LOCK = threading.Lock()
+_CLIENT_LOCK = threading.Lock()
+_SSO_LOGIN_LOCK = threading.Lock()
+
 AWS_CONFIG_PATH = f'{Path.home()}/.aws/config'
 AWS_CREDENTIAL_PATH = f'{Path.home()}/.aws/credentials'
+AWS_SSO_CACHE_PATH = f'{Path.home()}/.aws/sso/cache'
 AWS_DEFAULT_REGION = os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
 
 
@@ -49,7 +62,67 @@ def set_aws_creds(profile_name: str, *, verbose: bool = False) -> Optional[dict]
     :type verbose: bool
     """
 
-    # validate aws v2
+    _check_aws_cli_version()
+
+    global VERBOSE_MODE
+    VERBOSE_MODE = verbose
+
+    return _set_profile_credentials(profile_name, profile_name != 'default')
+
+
+def set_aws_creds_many(profile_names: list, *, verbose: bool = False, max_workers: int = 8) -> dict:
+    """
+    Retrieves AWS credentials from SSO for several profiles concurrently.
+
+    The per-profile work is dominated by HTTPS round trips to the SSO portal,
+    so profiles are fanned out over a thread pool; writes to the shared AWS
+    config/credential files are serialized internally.
+
+    Unlike set_aws_creds, each profile's credentials are stored under its own
+    section only — nothing is copied to the 'default' profile, since with
+    several profiles in flight the "winner" would be nondeterministic. Call
+    set_aws_creds afterwards for the one profile that should become default.
+
+    :param profile_names: AWS config profiles to retrieve credentials for
+    :type profile_names: list
+    :param verbose: Show verbose output, messages, etc.
+    :type verbose: bool
+    :param max_workers: Maximum number of concurrent profile refreshes
+    :type max_workers: int
+    :return: Mapping of profile name to the credentials retrieved for it
+    """
+
+    _check_aws_cli_version()
+
+    global VERBOSE_MODE
+    VERBOSE_MODE = verbose
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {name: executor.submit(_set_profile_credentials, name, False)
+                   for name in profile_names}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def _check_aws_cli_version() -> None:
+    """
+        Validates that AWS CLI Version 2 is installed.
+
+        The subprocess probe is a full CLI cold start (~hundreds of ms), so the
+        result is memoized at module level and only paid once per process.
+        """
+    global _AWS_CLI_VERSION_CHECKED
+    if _AWS_CLI_VERSION_CHECKED:
+        return
+
+    aws_path = shutil.which('aws')
+    if aws_path is None:
+        _print_error('\n AWS CLI Version 2 not found. Please install. Exiting.')
+        exit(1)
+
+    if _aws_cli_v2_on_disk(aws_path):
+        _AWS_CLI_VERSION_CHECKED = True
+        return
+
     try:
         aws_version = subprocess.run(['aws', '--version'], capture_output=True).stdout.decode('utf-8')
 
@@ -62,10 +135,28 @@ def set_aws_creds(profile_name: str, *, verbose: bool = False) -> Optional[dict]
             f'\nAn error occured trying to find AWS CLI version. Do you have AWS CLI Version 2 installed?\n{e}')
         exit(1)
 
-    global VERBOSE_MODE
-    VERBOSE_MODE = verbose
+    _AWS_CLI_VERSION_CHECKED = True
 
-    return _set_profile_credentials(profile_name, profile_name != 'default')
+
+def _aws_cli_v2_on_disk(aws_path) -> bool:
+    """
+        Detects AWS CLI Version 2 from the install layout without forking.
+
+        CLI v2 ships as a frozen bundle with an `awscli` data tree next to the
+        real binary (v1 is a plain Python entry point and has no such tree),
+        so a stat is enough to confirm v2. Unknown layouts return False and
+        the caller falls back to the `aws --version` subprocess probe.
+
+        :param aws_path: Path to the `aws` executable as found on PATH.
+        :type aws_path: str
+        :return: True if the layout identifies an AWS CLI v2 install.
+        """
+    resolved = Path(aws_path).resolve()
+    candidates = (
+        resolved.parent / 'awscli' / 'data' / 'cli.json',
+        resolved.parent.parent / 'libexec' / 'aws' / 'dist' / 'awscli' / 'data' / 'cli.json',
+    )
+    return any(candidate.is_file() for candidate in candidates)
 
 
 def _set_profile_credentials(profile_name: str, use_default=False) -> Optional[dict]:
@@ -83,56 +174,131 @@ def _set_profile_credentials(profile_name: str, use_default=False) -> Optional[d
         :type use_default: bool
         :return: None
         """
-    profile_opts = _get_aws_profile(profile_name)
+    config = _read_config(AWS_CONFIG_PATH)
+    profile_opts = _get_aws_profile(profile_name, config)
 
     if profile_opts != "NotSSO":
-        auth_token = _get_sso_cached_login(profile_name)
+        auth_token = _get_sso_cached_login(profile_name, profile_opts.get("sso_session"))
         credentials = _get_sso_role_credentials(profile_opts, auth_token)
 
-        if not use_default:
-            profile = _add_prefix(profile_name)
-            _store_aws_credentials(profile, profile_opts, credentials)
-        elif use_default:
-            _store_aws_credentials('default', profile_opts, credentials)
-            _copy_to_default_profile(profile_name)
-
+        with _CONFIG_FILE_LOCK:
+            credentials_config = _read_config(AWS_CREDENTIAL_PATH)
+            if not use_default:
+                profile = _add_prefix(profile_name)
+                _store_aws_credentials(profile, profile_opts, credentials, credentials_config)
+            elif use_default:
+                _store_aws_credentials('default', profile_opts, credentials, credentials_config)
+                _copy_to_default_profile(profile_name, config)
+                _write_config(AWS_CONFIG_PATH, config)
+
+            _write_config(AWS_CREDENTIAL_PATH, credentials_config)
         return credentials
 
 
-def _get_aws_profile(profile_name):
+def _get_aws_profile(profile_name, config: ConfigParser):
     _print_msg(f'\nReading profile: [{profile_name}]')
-    config = _read_config(AWS_CONFIG_PATH)
     prefixed_profile = _add_prefix(profile_name)
-    if prefixed_profile not in config.sections():
+    if prefixed_profile not in config:
         _print_error(
             f'\nProfile [{profile_name}] not found in AWS CLI configuration.You can create a new profile using the following command'
             f'\naws configure sso')
         return
-    profile_opts = config.items(prefixed_profile)
-    if "sso_session" in dict(profile_opts):
-        profile = dict(profile_opts)
-        sso_session = profile.get("sso_session")
-        sso_opts = config.items(f"sso-session {sso_session}")
-        profile.update(sso_opts)
-    else:
+    profile = dict(config[prefixed_profile])
+    sso_session = profile.get("sso_session")
+    if sso_session is None:
         _print_msg(f'\n [{profile_name}] is not an SSO profile')
-        profile = "NotSSO"
+        return "NotSSO"
+    profile.update(config[f"sso-session {sso_session}"])
     return profile
 
 
-def _get_sso_cached_login(profile_name) -> FrozenAuthToken:
-    _print_msg('\nChecking for SSO credentials...')
-    sso_token: Optional[DeferredRefreshableToken] = None
+def _botocore_session() -> botocore.session.Session:
+    """Returns a lazily-created botocore session shared across calls."""
+    global _BOTOCORE_SESSION
+    if _BOTOCORE_SESSION is None:
+        # session construction is not thread-safe; serialize the first build
+        # so set_aws_creds_many workers don't race it
+        with _CLIENT_LOCK:
+            if _BOTOCORE_SESSION is None:
+                _BOTOCORE_SESSION = botocore.session.Session()
+    return _BOTOCORE_SESSION
+
+
+def _sso_client(region):
+    """
+        Returns a boto3 SSO client for the given region, cached at module
+        level so multi-profile flows reuse the service model, endpoint
+        resolver and underlying HTTPS connection pool.
+        """
+    client = _SSO_CLIENTS.get(region)
+    if client is None:
+        # boto3.client goes through the (not thread-safe) default session, so
+        # guard the miss path; the cached path stays lock-free
+        with _CLIENT_LOCK:
+            client = _SSO_CLIENTS.get(region)
+            if client is None:
+                client = _SSO_CLIENTS.setdefault(region, boto3.client('sso', region_name=region))
+    return client
+
+
+def _read_sso_cached_token(sso_session_name) -> Optional[FrozenAuthToken]:
+    """
+        Reads the SSO token cached on disk by the AWS CLI for the given
+        sso-session, skipping the SSOTokenProvider (and any CLI login spawn)
+        entirely when the cached access token is still comfortably valid.
+
+        :param sso_session_name: Name of the sso-session the profile refers to.
+        :type sso_session_name: str
+        :return: A frozen auth token if the cached one is valid for more than
+            15 minutes, otherwise None.
+        """
+    if not sso_session_name:
+        return None
+
+    cache_file = Path(AWS_SSO_CACHE_PATH) / f'{hashlib.sha1(sso_session_name.encode("utf-8")).hexdigest()}.json'
     try:
-        sso_token = botocore.tokens.SSOTokenProvider(botocore.session.Session(),
-                                                     profile_name=profile_name).load_token()
-        auth_token = sso_token.get_frozen_token()  # noqa
-    except botocore.exceptions.TokenRetrievalError as e:
-        _print_msg(
-            f'{e}. Invoking Session Login')
-        _spawn_cli_for_auth(profile_name)
-
-    auth_token = sso_token.get_frozen_token()
+        with open(cache_file) as source:
+            cached = json.load(source)
+        expires_at = datetime.fromisoformat(cached['expiresAt'].replace('Z', '+00:00'))
+        access_token = cached['accessToken']
+        now = datetime.now().astimezone(UTC)
+        # a naive expiresAt makes this comparison raise TypeError, and a
+        # non-string one raises AttributeError at .replace above; treat both
+        # like any other malformed cache entry and fall back to the provider
+        if expires_at > (now + timedelta(minutes=15)):
+            return FrozenAuthToken(access_token, expiration=expires_at)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    return None
+
+
+def _get_sso_cached_login(profile_name, sso_session_name=None) -> FrozenAuthToken:
+    _print_msg('\nChecking for SSO credentials...')
+
+    auth_token = _read_sso_cached_token(sso_session_name)
+    if auth_token is not None:
+        _print_success(f'Found credentials. Valid until {auth_token.expiration.astimezone(tzlocal())}')
+        return auth_token
+
+    # profiles in a batch usually share one sso-session, so serialize the
+    # refresh/login fallback: only the first worker authenticates, the rest
+    # pick up the freshly cached token once the lock is released
+    with _SSO_LOGIN_LOCK:
+        auth_token = _read_sso_cached_token(sso_session_name)
+        if auth_token is None:
+            try:
+                sso_token: DeferredRefreshableToken = botocore.tokens.SSOTokenProvider(
+                    _botocore_session(), profile_name=profile_name).load_token()
+                auth_token = sso_token.get_frozen_token()
+            except (botocore.exceptions.TokenRetrievalError, botocore.exceptions.UnauthorizedSSOTokenError) as e:
+                _print_msg(
+                    f'{e}. Invoking Session Login')
+                _spawn_cli_for_auth(profile_name)
+                # reload the freshly minted token from the CLI login
+                sso_token = botocore.tokens.SSOTokenProvider(
+                    _botocore_session(), profile_name=profile_name).load_token()
+                auth_token = sso_token.get_frozen_token()
+
     expires_at = auth_token.expiration
     now = datetime.now().astimezone(UTC)
 
@@ -146,7 +312,7 @@ def _get_sso_cached_login(profile_name) -> FrozenAuthToken:
 def _get_sso_role_credentials(profile, auth_token: FrozenAuthToken):
     _print_msg('\nFetching short-term CLI/Boto3 session token...')
 
-    client = boto3.client('sso', region_name=profile['sso_region'])
+    client = _sso_client(profile['sso_region'])
     response = client.get_role_credentials(
         roleName=profile['sso_role_name'],
         accountId=profile['sso_account_id'],
@@ -159,11 +325,10 @@ def _get_sso_role_credentials(profile, auth_token: FrozenAuthToken):
     return response["roleCredentials"]
 
 
-def _store_aws_credentials(profile_name, profile_opts, credentials):
+def _store_aws_credentials(profile_name, profile_opts, credentials, config: ConfigParser):
     _print_msg(f'\nAdding to credential files under [{profile_name}]')
 
     region = profile_opts.get("region", AWS_DEFAULT_REGION)
-    config = _read_config(AWS_CREDENTIAL_PATH)
 
     if config.has_section(profile_name):
         config.remove_section(profile_name)
@@ -174,14 +339,10 @@ def _store_aws_credentials(profile_name, profile_opts, credentials):
     config.set(profile_name, "aws_secret_access_key ", credentials["secretAccessKey"])
     config.set(profile_name, "aws_session_token", credentials["sessionToken"])
 
-    _write_config(AWS_CREDENTIAL_PATH, config)
 
-
-def _copy_to_default_profile(profile_name):
+def _copy_to_default_profile(profile_name, config: ConfigParser):
     _print_msg(f'Copying profile [{profile_name}] to [default]')
 
-    config = _read_config(AWS_CONFIG_PATH)
-
     if config.has_section('default'):
         config.remove_section('default')
 
@@ -190,11 +351,12 @@ def _copy_to_default_profile(profile_name):
     for key, value in config.items(profile):
         config.set('default', key, value)
 
-    _write_config(AWS_CONFIG_PATH, config)
-
 
-def _spawn_cli_for_auth(profile):
-    subprocess.run(['aws', 'sso', 'login', '--profile', re.sub(r"^profile ", "", str(profile))],
+def _spawn_cli_for_auth(profile_name):
+    # callers pass the bare profile name, never the 'profile '-prefixed
+    # section name, so no prefix stripping is needed (and a profile literally
+    # named 'profile foo' is no longer mangled)
+    subprocess.run(['aws', 'sso', 'login', '--profile', profile_name],
                    stderr=sys.stderr,
                    stdout=sys.stdout,
                    check=True)
@@ -236,8 +398,17 @@ def _read_config(path) -> ConfigParser:
 
 
 def _write_config(path: str, config: ConfigParser) -> None:
-    with open(path, "w") as destination:
-        config.write(destination)
+    # write to a sibling temp file and swap it in atomically, so a concurrent
+    # `aws` CLI never reads a half-written config/credentials file
+    directory = os.path.dirname(path) or '.'
+    destination = tempfile.NamedTemporaryFile('w', dir=directory, delete=False)
+    try:
+        with destination:
+            config.write(destination)
+        os.replace(destination.name, path)
+    except Exception:
+        os.unlink(destination.name)
+        raise
 
 
 if __name__ == "__main__":
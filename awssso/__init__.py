@@ -5,7 +5,7 @@
 @project: py-aws-sso
 @author : pritam 
 """
-from .__awssso import set_aws_creds
+from .__awssso import set_aws_creds, set_aws_creds_many
 
 __version__ = "0.1.1"
-__all__ = ["set_aws_creds"]
+__all__ = ["set_aws_creds", "set_aws_creds_many"]